@@ -1,5 +1,8 @@
-from .ingest import get_data
+from .ingest import get_data, get_data_many, StripeClient
 from .data_transform import *
 from .metrics.charge_metrics import *
 from .metrics.subscription_metrics import *
+from .metrics.lifetime_metrics import *
 from .config import *
+from .sketches import HyperLogLog, SubscriberSketches
+from .sql_engine import DuckDBEngine
@@ -0,0 +1,122 @@
+import argparse
+import time
+import tracemalloc
+
+import pandas as pd
+import stripe
+
+from .fake_server import FakeStripeProcess, resource_paths, synthetic_fixtures
+from .ingest import get_data
+
+
+# seconds of latency (and jitter) per request
+latency_profiles = {
+    'local': (0.0, 0.0),
+    'lan': (0.002, 0.001),
+    'region': (0.03, 0.01),
+    'intercontinental': (0.15, 0.05),
+}
+
+
+def benchmark_get_data(
+        resource: str = 'Charge',
+        n_objects: int = 10000,
+        profiles: list or None = None,
+        page_size: int = 100,
+        error_rate: float = 0.0,
+        max_network_retries: int = 3,
+        seed: int = 0,
+        **kwargs
+) -> pd.DataFrame:
+    """
+    Measure get_data throughput and peak memory against a local FakeStripeServer running in a subprocess,
+    once per latency profile. Throughput and peak memory come from separate runs.
+
+    Parameters
+    ----------
+    resource : str, default 'Charge'
+        one of Subscription, Charge, Product, BalanceTransaction
+    n_objects : int, default 10000
+        amount of objects of the resource served
+    profiles : list or None, default None
+        names from latency_profiles, defaults to all of them
+    page_size : int, default 100
+        maximum objects per page served
+    error_rate : float, default 0.0
+        fraction of requests answered with a retryable error
+    max_network_retries : int, default 3
+        stripe retries used while benchmarking
+    seed : int, default 0
+        seed for fixtures, jitter and error injection
+    **kwargs
+        arbitrary keyword arguments passed to get_data
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per profile with objects, requests, seconds, objects_per_second and peak_memory_mb
+    """
+    if resource not in resource_paths:
+        raise ValueError(f'resource must be one of {list(resource_paths)}')
+
+    fixtures = synthetic_fixtures(
+        n_subscriptions=n_objects if resource == 'Subscription' else 0,
+        n_charges=n_objects if resource in ('Charge', 'BalanceTransaction') else 0,
+        n_products=n_objects if resource == 'Product' else 5,
+        seed=seed
+    )
+    if resource == 'Subscription':
+        kwargs.setdefault('status', 'all')
+
+    saved = stripe.api_key, stripe.api_base, stripe.api_version, stripe.max_network_retries
+    stripe.max_network_retries = max_network_retries
+
+    results = []
+    try:
+        for profile in profiles or list(latency_profiles):
+            latency, jitter = latency_profiles[profile]
+            server_kwargs = dict(fixtures=fixtures, latency=latency, jitter=jitter, page_size=page_size,
+                                 error_rate=error_rate, seed=seed)
+
+            # timing and memory are measured in separate runs, tracemalloc slows get_data down
+            with FakeStripeProcess(**server_kwargs) as server:
+                start = time.perf_counter()
+                df = get_data(resource, api_key='sk_test_fake', api_base=server.url, **kwargs)
+                seconds = time.perf_counter() - start
+            requests_served = server.requests_served
+            objects = len(df)
+            del df
+
+            with FakeStripeProcess(**server_kwargs) as server:
+                tracemalloc.start()
+                try:
+                    get_data(resource, api_key='sk_test_fake', api_base=server.url, **kwargs)
+                    _, peak = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+
+            results.append({
+                'profile': profile,
+                'objects': objects,
+                'requests': requests_served,
+                'seconds': seconds,
+                'objects_per_second': objects / seconds if seconds else float('nan'),
+                'peak_memory_mb': peak / 2 ** 20,
+            })
+    finally:
+        stripe.api_key, stripe.api_base, stripe.api_version, stripe.max_network_retries = saved
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark get_data against a local fake Stripe API.')
+    parser.add_argument('--resource', default='Charge', choices=list(resource_paths))
+    parser.add_argument('--objects', type=int, default=10000)
+    parser.add_argument('--profiles', nargs='+', choices=list(latency_profiles))
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    print(benchmark_get_data(args.resource, args.objects, args.profiles, args.page_size,
+                             args.error_rate).to_string(index=False))
@@ -1,5 +1,6 @@
 import pandas as pd
 from .date_manipulation import _last_interval_days
+from .sketches import SubscriberSketches
 import numpy as np
 
 
@@ -94,6 +95,76 @@ def enrich_charges(
     return charges_enriched
 
 
+def intern_ids(sub_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Intern subscription and customer ids once, converting the id and customer columns to category.
+
+    The categories are the id dictionaries and the category codes are used directly by new_subscribers,
+    new_subscriptions, churned_subscriptions and the rate metrics, instead of hashing the string ids on
+    every call. Ids are only decoded back to strings for the returned Series.
+
+    Parameters
+    ----------
+    sub_df : pd.DataFrame
+        Stripe Subscription DataFrame, enriched or not
+
+    Returns
+    -------
+    pd.DataFrame
+        Subscription Pandas DataFrame with interned id and customer columns
+    """
+    interned = sub_df.copy()
+    for column in ('id', 'customer'):
+        if not isinstance(interned[column].dtype, pd.CategoricalDtype):
+            interned[column] = interned[column].astype('category')
+
+    return interned
+
+
+def _intern(ids: pd.Series) -> tuple:
+    # int32 codes and the dictionary decoding them, category columns (see intern_ids) reuse their codes
+    if isinstance(ids.dtype, pd.CategoricalDtype):
+        return ids.cat.codes.to_numpy().astype(np.int32), np.asarray(ids.cat.categories)
+
+    codes, uniques = pd.factorize(ids)
+
+    return codes.astype(np.int32), np.asarray(uniques)
+
+
+def _difference(codes: np.ndarray, size: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # codes in rows a and not in rows b, using bitmaps over the dictionary (missing ids are coded -1)
+    in_a = np.zeros(size, dtype=bool)
+    in_b = np.zeros(size, dtype=bool)
+    in_a[codes[a & (codes >= 0)]] = True
+    in_b[codes[b & (codes >= 0)]] = True
+
+    return np.flatnonzero(in_a & ~in_b)
+
+
+def _active_mask(
+        sub_df: pd.DataFrame,
+        date: str,
+        product: str or None = None,
+        interval: int = 30
+) -> np.ndarray:
+    # rows of active subscriptions, see active_subscriptions
+    date = pd.Timestamp(date)
+    next_date = date + pd.Timedelta(days=interval)
+    df = sub_df
+
+    mask = (
+        (df['created'] < date) &
+        ((df['canceled_at'] > date) | pd.isnull(df['canceled_at'])) &
+        ((df['cancel_at'] > date) | pd.isnull(df['cancel_at'])) &
+        ((df['trial_end'] < next_date) | pd.isnull(df['trial_end']))
+    ).to_numpy()
+
+    if (product is not None) and ('name' in df.columns):
+        mask = mask & (df['name'] == product).to_numpy()
+
+    return mask
+
+
 def active_subscriptions(
         sub_df: pd.DataFrame,
         date: str,
@@ -121,29 +192,16 @@ def active_subscriptions(
         Pandas Series containing the ids of active subscriptions
     """
     # if product is not None, enrich_subscriptions is needed
-    date = pd.Timestamp(date)
-    next_date = date + pd.Timedelta(days=interval)
-    df = sub_df.copy()
-
-    active_subs = df[
-        (df['created'] < date) &
-        ((df['canceled_at'] > date) | pd.isnull(df['canceled_at'])) &
-        ((df['cancel_at'] > date) | pd.isnull(df['cancel_at'])) &
-        ((df['trial_end'] < next_date) | pd.isnull(df['trial_end']))
-        ]
-
-    if (product is not None) and ('name' in active_subs.columns):
-        active_subs = active_subs[active_subs['name'] == product]
-
-    return active_subs['id']
+    return sub_df['id'][_active_mask(sub_df, date, product, interval)]
 
 
 def active_subscribers(
         sub_df: pd.DataFrame,
         date: str,
         product: str or None = None,
-        interval: int = 30
-) -> pd.Series:
+        interval: int = 30,
+        sketches: SubscriberSketches or None = None
+) -> pd.Series or float:
     """
     Get id of active subscribers in the last interval (default 30) days starting from date ('YYYY/MM/DD').
     If product name is provided, filter subscribers by product (Subscription must be enriched with product data).
@@ -158,17 +216,21 @@ def active_subscribers(
         Name of a Stripe product
     interval : int, default 30
         Amount of days in the past to check
+    sketches : SubscriberSketches or None, default None
+        Prebuilt sketches of sub_df (with the same interval), return their approximate count instead of the ids
 
     Returns
     -------
-    pd.Series
-        Pandas Series containing the ids of active subscribers
+    pd.Series or float
+        Pandas Series containing the ids of active subscribers, or their approximate count if sketches is given
     """
-    # if product is not None, enrich_subscriptions is needed
-    subscriptions = active_subscriptions(sub_df, date, product, interval)
-    df = sub_df.copy()
+    if sketches is not None:
+        if sketches.interval != interval:
+            raise ValueError(f'sketches were built with interval={sketches.interval}, not {interval}')
+        return sketches.active_count(date, product)
 
-    subscribers = df[df['id'].isin(subscriptions)]['customer']
+    # if product is not None, enrich_subscriptions is needed
+    subscribers = sub_df['customer'][_active_mask(sub_df, date, product, interval)]
     unique_subs = subscribers.unique()
 
     return pd.Series(unique_subs)
@@ -178,8 +240,9 @@ def new_subscribers(
         sub_df: pd.DataFrame,
         date: str,
         product: str or None = None,
-        interval: int = 30
-) -> pd.Series:
+        interval: int = 30,
+        sketches: SubscriberSketches or None = None
+) -> pd.Series or float:
     """
     Get id of new subscribers in the last interval (default 30) days starting from date ('YYYY/MM/DD').
     If product name is provided, filter subscribers by product (Subscription must be enriched with product data).
@@ -194,28 +257,29 @@ def new_subscribers(
         Name of a Stripe product
     interval : int, default 30
         Amount of days in the past to check
+    sketches : SubscriberSketches or None, default None
+        Prebuilt sketches of sub_df, return their approximate count instead of the ids
 
     Returns
     -------
-    pd.Series
-        Pandas Series containing the ids of new subscribers
+    pd.Series or float
+        Pandas Series containing the ids of new subscribers, or their approximate count if sketches is given
     """
-    df = sub_df.copy()
-    date, last_date = _last_interval_days(date, interval)
+    if sketches is not None:
+        # error is relative to the size of the union of both periods
+        return sketches.new_count(date, product, interval)
 
-    if product:
-        # enrich_subscriptions is needed
-        df = df[df['name'] == product]
+    # if product is not None, enrich_subscriptions is needed
+    date, last_date = _last_interval_days(date, interval)
 
-    prev_active_subscribers = active_subscribers(sub_df, last_date, product)
-    cur_active_subscribers = active_subscribers(sub_df, date, product)
+    prev = _active_mask(sub_df, last_date, product)
+    cur = _active_mask(sub_df, date, product)
 
-    prev = set(sub_df[sub_df['customer'].isin(prev_active_subscribers)]['customer'].unique())
-    cur = set(sub_df[sub_df['customer'].isin(cur_active_subscribers)]['customer'].unique())
+    codes, customers = _intern(sub_df['customer'])
 
     # in current and not in previous
     # note: should also check whether the new subscriber was subscribed once in the past
-    return pd.Series(list(cur - prev), dtype=pd.StringDtype())
+    return pd.Series(customers[_difference(codes, len(customers), cur, prev)], dtype=pd.StringDtype())
 
 
 def new_subscriptions(
@@ -247,14 +311,12 @@ def new_subscriptions(
     # if product is not None, enrich_subscriptions is needed
     date, last_date = _last_interval_days(date, interval)
 
-    prev_active_subscriptions = active_subscriptions(sub_df, last_date, product)
-    cur_active_subscriptions = active_subscriptions(sub_df, date, product)
-
-    prev = set(sub_df[sub_df['id'].isin(prev_active_subscriptions)]['id'].unique())
-    cur = set(sub_df[sub_df['id'].isin(cur_active_subscriptions)]['id'].unique())
+    prev = _active_mask(sub_df, last_date, product)
+    cur = _active_mask(sub_df, date, product)
+    codes, ids = _intern(sub_df['id'])
 
     # in current and not in previous
-    return pd.Series(list(cur - prev), dtype=pd.StringDtype())
+    return pd.Series(ids[_difference(codes, len(ids), cur, prev)], dtype=pd.StringDtype())
 
 
 def churn_dates(
@@ -373,7 +435,8 @@ def churned_customers(
         sub_df: pd.DataFrame,
         date: str,
         product: str or None = None,
-        interval: int = 30
+        interval: int = 30,
+        sketches: SubscriberSketches or None = None
 ):
     """
     Get the subscribers that churned in the last interval (default 30) days from date ('YYYY/MM/DD').
@@ -389,16 +452,22 @@ def churned_customers(
         Name of a Stripe product
     interval : int, default 30
         Amount of days in the past to check
+    sketches : SubscriberSketches or None, default None
+        Prebuilt sketches of sub_df, return their approximate count instead of the ids
+        (a canceled subscription in the window is enough, at day granularity)
 
     Returns
     -------
-    pd.Series
-        Pandas Series containing the ids of churned subscribers
+    pd.Series or float
+        Pandas Series containing the ids of churned subscribers, or their approximate count if sketches is given
     """
+    if sketches is not None:
+        return sketches.churned_count(date, product, interval)
+
     # if product is not None, enrich_subscriptions is needed
     date, last_date = _last_interval_days(date, interval)
 
-    customer_churn_dates = churn_dates(sub_df, date, product)
+    customer_churn_dates = churn_dates(sub_df, date, product, interval)
     last_month_churned_customers = pd.Series([], dtype=pd.StringDtype())
     if len(customer_churn_dates['churn date']) != 0:
         last_month_churned_customers = customer_churn_dates[(customer_churn_dates['churn date'] > last_date) &
@@ -436,10 +505,11 @@ def churned_subscriptions(
     # if product is not None, enrich_subscriptions is needed
     date, last_date = _last_interval_days(date, interval)
 
-    cur_active = active_subscriptions(sub_df, date, product)
-    prev_active = active_subscriptions(sub_df, last_date, product)
+    cur_active = _active_mask(sub_df, date, product)
+    prev_active = _active_mask(sub_df, last_date, product)
+    codes, ids = _intern(sub_df['id'])
 
-    churned = list(set(prev_active) - set(cur_active))
-    churned = pd.Series(churned, dtype=pd.StringDtype())
+    # in previous and not in current
+    churned = pd.Series(ids[_difference(codes, len(ids), prev_active, cur_active)], dtype=pd.StringDtype())
 
     return churned
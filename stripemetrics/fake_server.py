@@ -0,0 +1,334 @@
+import json
+import multiprocessing
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+resource_paths = {'Subscription': 'subscriptions', 'Charge': 'charges', 'Product': 'products',
+                  'BalanceTransaction': 'balance_transactions'}
+
+
+# ------------ Synthetic Fixtures -------------
+
+def synthetic_fixtures(
+        n_subscriptions: int = 1000,
+        n_charges: int = 1000,
+        n_products: int = 5,
+        n_customers: int or None = None,
+        seed: int = 0
+) -> dict:
+    """
+    Generate synthetic Stripe objects for the fake server, with the fields used by get_data, enrich_subscriptions
+    and enrich_charges.
+
+    Parameters
+    ----------
+    n_subscriptions : int, default 1000
+        Amount of Subscription objects
+    n_charges : int, default 1000
+        Amount of Charge objects, each one with a BalanceTransaction
+    n_products : int, default 5
+        Amount of Product objects
+    n_customers : int or None, default None
+        Amount of distinct customers, defaults to half the subscriptions
+    seed : int, default 0
+        Seed of the random generator
+
+    Returns
+    -------
+    dict
+        Lists of objects keyed by resource path (subscriptions, charges, products, balance_transactions),
+        sorted by created in descending order like the Stripe API
+    """
+    rng = random.Random(seed)
+    n_customers = n_customers or max(n_subscriptions // 2, 1)
+    start = int(time.mktime((2021, 1, 1, 0, 0, 0, 0, 0, -1)))
+    span = 2 * 365 * 86400
+
+    products = [{'id': f'prod_{i:06d}', 'object': 'product', 'name': f'Product {i}', 'active': True,
+                 'created': start + i} for i in range(n_products)]
+
+    subscriptions = []
+    for i in range(n_subscriptions):
+        created = start + rng.randrange(span)
+        canceled_at = created + rng.randrange(86400, 365 * 86400) if rng.random() < 0.4 else None
+        trial_end = created + 14 * 86400 if rng.random() < 0.2 else None
+        discount = None
+        if rng.random() < 0.2:
+            discount = {'coupon': {'percent_off': rng.choice([10, 20, 50]),
+                                   'duration': rng.choice(['once', 'repeating', 'forever'])}}
+
+        subscriptions.append({
+            'id': f'sub_{i:08d}',
+            'object': 'subscription',
+            'customer': f'cus_{rng.randrange(n_customers):08d}',
+            'created': created,
+            'start_date': created,
+            'current_period_start': created,
+            'current_period_end': created + 30 * 86400,
+            'canceled_at': canceled_at,
+            'cancel_at': None,
+            'ended_at': canceled_at,
+            'trial_start': created if trial_end else None,
+            'trial_end': trial_end,
+            'status': 'canceled' if canceled_at else rng.choice(['active', 'active', 'active', 'past_due']),
+            'quantity': rng.choice([1, 1, 1, 2, 5]),
+            'discount': discount,
+            'plan': {'amount': rng.choice([900, 2900, 9900]), 'interval': rng.choice(['month', 'year']),
+                     'product': rng.choice(products)['id'] if products else None},
+            'metadata': {},
+        })
+
+    charges = []
+    balance_transactions = []
+    for i in range(n_charges):
+        created = start + rng.randrange(span)
+        amount = rng.choice([900, 2900, 9900])
+        refunded = rng.random() < 0.05
+        currency = rng.choice(['usd', 'usd', 'usd', 'eur', 'brl'])
+        metadata = {'product_key': rng.choice(products)['id']} if products and rng.random() < 0.9 else {}
+
+        charges.append({
+            'id': f'ch_{i:08d}',
+            'object': 'charge',
+            'customer': f'cus_{rng.randrange(n_customers):08d}',
+            'created': created,
+            'amount': amount,
+            'amount_captured': amount,
+            'amount_refunded': amount if refunded else 0,
+            'refunded': refunded,
+            'paid': True,
+            'status': 'succeeded',
+            'currency': currency,
+            'metadata': metadata,
+        })
+        balance_transactions.append({
+            'id': f'txn_{i:08d}',
+            'object': 'balance_transaction',
+            'source': f'ch_{i:08d}',
+            'created': created,
+            'amount': amount,
+            'currency': 'usd',
+            'exchange_rate': None if currency == 'usd' else round(rng.uniform(0.1, 1.2), 6),
+            'type': 'charge',
+        })
+
+    fixtures = {'subscriptions': subscriptions, 'charges': charges, 'products': products,
+                'balance_transactions': balance_transactions}
+    for objects in fixtures.values():
+        objects.sort(key=lambda x: x['created'], reverse=True)
+
+    return fixtures
+
+
+# ------------ Fake Server -------------
+
+def _matches(obj: dict, path: str, query: dict) -> bool:
+    created = obj['created']
+    if 'created[gte]' in query and created < int(query['created[gte]']):
+        return False
+    if 'created[gt]' in query and created <= int(query['created[gt]']):
+        return False
+    if 'created[lt]' in query and created >= int(query['created[lt]']):
+        return False
+    if 'created[lte]' in query and created > int(query['created[lte]']):
+        return False
+
+    if path == 'subscriptions':
+        # like Stripe, canceled subscriptions are only listed when asked for
+        status = query.get('status')
+        if status is None:
+            return obj['status'] != 'canceled'
+        if status != 'all':
+            return obj['status'] == status
+
+    return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes, with Nagle on keep-alive requests would stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: dict, headers: dict or None = None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('Request-Id', f'req_{self.server.fake.requests_served:08d}')
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        fake = self.server.fake
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip('/').split('/')[-1]
+
+        with fake._lock:
+            fake.requests_served += 1
+            inject_error = fake._rng.random() < fake.error_rate
+            delay = fake.latency + fake._rng.uniform(0, fake.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if inject_error:
+            return self._send(429, {'error': {'type': 'rate_limit_error', 'code': 'rate_limit',
+                                              'message': 'Injected error from the fake Stripe server'}},
+                              {'Stripe-Should-Retry': 'true'})
+
+        if path not in fake.fixtures:
+            return self._send(404, {'error': {'type': 'invalid_request_error',
+                                              'message': f'Unrecognized request URL (GET: {url.path})'}})
+
+        objects = fake.fixtures[path]
+        limit = min(int(query.get('limit', 10)), fake.page_size)
+        position = 0
+        if 'starting_after' in query:
+            position = fake._positions[path].get(query['starting_after'], len(objects) - 1) + 1
+
+        page = []
+        has_more = False
+        for obj in objects[position:]:
+            if not _matches(obj, path, query):
+                continue
+            if len(page) == limit:
+                has_more = True
+                break
+            page.append(obj)
+
+        self._send(200, {'object': 'list', 'url': f'/v1/{path}', 'has_more': has_more, 'data': page})
+
+
+class FakeStripeServer:
+    """
+    Local stand-in for the Stripe API serving paginated list endpoints for Subscription, Charge, Product and
+    BalanceTransaction from synthetic fixtures.
+
+    Point stripe at it with get_data(..., api_base=server.url). Injected errors are 429 responses that ask the
+    client to retry, so they only succeed with stripe.max_network_retries > 0.
+
+    Parameters
+    ----------
+    fixtures : dict or None, default None
+        Objects keyed by resource path, defaults to synthetic_fixtures()
+    latency : float, default 0.0
+        Seconds to wait before answering each request
+    jitter : float, default 0.0
+        Maximum random seconds added to latency
+    page_size : int, default 100
+        Maximum objects per page, regardless of the requested limit
+    error_rate : float, default 0.0
+        Fraction of requests answered with an error
+    seed : int, default 0
+        Seed for jitter and error injection
+    host : str, default '127.0.0.1'
+    port : int, default 0
+        Port to listen on, 0 picks a free one
+    """
+
+    def __init__(
+            self,
+            fixtures: dict or None = None,
+            latency: float = 0.0,
+            jitter: float = 0.0,
+            page_size: int = 100,
+            error_rate: float = 0.0,
+            seed: int = 0,
+            host: str = '127.0.0.1',
+            port: int = 0
+    ):
+        self.fixtures = fixtures if fixtures is not None else synthetic_fixtures(seed=seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.error_rate = error_rate
+        self.requests_served = 0
+
+        self._positions = {path: {obj['id']: i for i, obj in enumerate(objects)}
+                           for path, objects in self.fixtures.items()}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeStripeServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> 'FakeStripeServer':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _serve(kwargs: dict, urls, stop, served):
+    server = FakeStripeServer(**kwargs).start()
+    urls.put(server.url)
+    stop.wait()
+    server.stop()
+    served.value = server.requests_served
+
+
+class FakeStripeProcess:
+    """
+    Run a FakeStripeServer in a subprocess, so the server does not compete with the client for the GIL
+    and its allocations are not traced by the client's tracemalloc.
+
+    Takes the same parameters as FakeStripeServer. requests_served is available after stop().
+    """
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._context = multiprocessing.get_context('spawn')
+        self._stop = self._context.Event()
+        self._served = self._context.Value('i', 0)
+        self._process = None
+        self.url = None
+
+    @property
+    def requests_served(self) -> int:
+        return self._served.value
+
+    def start(self) -> 'FakeStripeProcess':
+        urls = self._context.Queue()
+        self._process = self._context.Process(target=_serve, args=(self._kwargs, urls, self._stop, self._served),
+                                              daemon=True)
+        self._process.start()
+        self.url = urls.get(timeout=60)
+
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._process.join()
+
+    def __enter__(self) -> 'FakeStripeProcess':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,7 +1,12 @@
 import stripe
+import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from types import FunctionType
+from stripe.api_requestor import APIRequestor
+from stripe.http_client import RequestsClient
 from .date_manipulation import *
 from .config import stripe_api_version
 
@@ -13,6 +18,7 @@ def get_data(
         start_date: str = None,
         end_date: str = None,
         date_hour_type: FunctionType = None,
+        api_base: str = None,
         **kwargs
 ) -> pd.DataFrame:
     """
@@ -30,6 +36,8 @@ def get_data(
         a date of form 'YYYY/MM/DD'
     date_hour_type : FunctionType, default None
         a function that changes the behaviour of the date and hours
+    api_base : str, default None
+        base url of the stripe API, e.g. the url of a local FakeStripeServer
     api_version : str, default None
     **kwargs
         arbitrary keyword arguments
@@ -43,19 +51,33 @@ def get_data(
 
     if api_version:
         stripe.api_version = api_version
-    if start_date:
-        start_date = int(time.mktime(
-            pd.Timestamp(start_date).timetuple())
-        )
-    if end_date:
-        end_date = int(time.mktime(
-            pd.Timestamp(end_date).timetuple())
-        )
+    start_date = _to_timestamp(start_date)
+    end_date = _to_timestamp(end_date)
+
+    # stripe has no per request api base, set it only while paging and restore it afterwards
+    saved_api_base = stripe.api_base
+    if api_base:
+        stripe.api_base = api_base
+    try:
+        resource_list = getattr(stripe, resource).list(limit=100, created={"gte": start_date, "lt": end_date},
+                                                       **kwargs)
+        lst = [resource for resource in resource_list.auto_paging_iter()]
+    finally:
+        stripe.api_base = saved_api_base
+
+    return _to_dataframe(lst, date_hour_type)
 
-    resource_list = getattr(stripe, resource).list(limit=100, created={"gte": start_date, "lt": end_date}, **kwargs)
-    lst = [resource for resource in resource_list.auto_paging_iter()]
 
+def _to_timestamp(date):
+    if date:
+        return int(time.mktime(pd.Timestamp(date).timetuple()))
+
+    return date
+
+
+def _to_dataframe(lst: list, date_hour_type: FunctionType = None) -> pd.DataFrame:
     df = pd.DataFrame(lst)
+    date_columns = []
     if len(df) > 0:
         mask = [col in date_columns_names for col in df.columns]
         date_columns = list(np.array(df.columns)[mask])
@@ -69,3 +91,181 @@ def get_data(
             df[date_column] = df[date_column].apply(date_hour_type)
 
     return df
+
+
+class _RequestsClient(RequestsClient):
+    # stripe reads retries from the global stripe.max_network_retries, keep them per client instead
+    def __init__(self, max_network_retries: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self._retries = max_network_retries
+
+    def _max_network_retries(self):
+        return self._retries
+
+
+def pooled_session(max_connections: int = 10) -> requests.Session:
+    """
+    Create a keep-alive requests Session holding at most max_connections connections per host,
+    threads wait for a free connection instead of opening new ones.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_connections, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+class StripeClient:
+    """
+    Stripe API client holding its own key, version and keep-alive HTTP session, without touching the
+    global stripe configuration, so several accounts can be ingested concurrently in one process.
+
+    Parameters
+    ----------
+    api_key : str
+        a key with read access to the stripe API
+    api_version : str, default stripe_api_version
+    stripe_account : str, default None
+        id of a connected account, requests are made on its behalf
+    api_base : str, default None
+        base url of the stripe API, e.g. the url of a local FakeStripeServer
+    session : requests.Session, default None
+        session to send requests with, can be shared between clients (see pooled_session)
+    max_network_retries : int, default 3
+        retries on connection errors and retryable responses
+    """
+
+    def __init__(
+            self,
+            api_key: str,
+            api_version: str = stripe_api_version,
+            stripe_account: str = None,
+            api_base: str = None,
+            session: requests.Session = None,
+            max_network_retries: int = 3
+    ):
+        self.api_key = api_key
+        self.api_version = api_version
+        self.stripe_account = stripe_account
+        self.api_base = api_base or 'https://api.stripe.com'
+        self.session = session or pooled_session()
+        self._requestor = APIRequestor(
+            key=api_key,
+            client=_RequestsClient(max_network_retries=max_network_retries, session=self.session),
+            api_base=self.api_base,
+            api_version=api_version,
+            account=stripe_account
+        )
+
+    def list(self, resource: str, **params):
+        """
+        Iterate over every object of a resource as StripeObjects (like stripe's auto_paging_iter),
+        following pagination.
+        """
+        url = getattr(stripe, resource).class_url()
+        params = {'limit': 100, **params}
+
+        while True:
+            response, _ = self._requestor.request('get', url, params)
+            page = stripe.util.convert_to_stripe_object(response, self.api_key, self.api_version,
+                                                        self.stripe_account)
+            yield from page['data']
+
+            if not page['has_more'] or not page['data']:
+                break
+            params['starting_after'] = page['data'][-1]['id']
+
+    def get_data(
+            self,
+            resource: str,
+            start_date: str = None,
+            end_date: str = None,
+            date_hour_type: FunctionType = None,
+            **kwargs
+    ) -> pd.DataFrame:
+        """
+        Get a certain resource from stripe api, return it as a pandas DataFrame (see get_data).
+        """
+        created = {"gte": _to_timestamp(start_date), "lt": _to_timestamp(end_date)}
+        lst = list(self.list(resource, created=created, **kwargs))
+
+        return _to_dataframe(lst, date_hour_type)
+
+    def close(self):
+        self.session.close()
+
+
+def get_data_many(
+        accounts: dict,
+        resource: str,
+        workers: int = 8,
+        max_connections: int or None = None,
+        max_network_retries: int = 3,
+        return_exceptions: bool = True,
+        start_date: str = None,
+        end_date: str = None,
+        date_hour_type: FunctionType = None,
+        **kwargs
+) -> dict:
+    """
+    Get a certain resource from several stripe accounts in parallel threads, return a pandas DataFrame per account.
+
+    Clients built from keys or arguments share one pooled keep-alive session, so at most max_connections
+    connections are open at any time. No global stripe state is changed.
+    A failing account does not stop the others, its exception is returned in place of its DataFrame.
+
+    Parameters
+    ----------
+    accounts : dict
+        account name to an api key, a dict of StripeClient arguments or a StripeClient
+    resource : str
+        a stripe resource/table such as Charge, Subscription, Product
+    workers : int, default 8
+        amount of accounts ingested at the same time
+    max_connections : int or None, default None
+        size of the shared connection pool, defaults to workers
+    max_network_retries : int, default 3
+        retries of the clients built from keys or arguments, unless given in the arguments
+    return_exceptions : bool, default True
+        return the exception of a failed account instead of its DataFrame, if False the first exception
+        is raised once every account finished
+    start_date : str, default None
+        a date of form 'YYYY/MM/DD'
+    end_date : str, default None
+        a date of form 'YYYY/MM/DD'
+    date_hour_type : FunctionType, default None
+        a function that changes the behaviour of the date and hours
+    **kwargs
+        arbitrary keyword arguments
+
+    Returns
+    -------
+    dict
+        account name to Pandas DataFrame with the requested stripe data (or the exception raised)
+    """
+    session = pooled_session(max_connections or workers)
+
+    clients = {}
+    for name, account in accounts.items():
+        if isinstance(account, str):
+            account = StripeClient(account, session=session, max_network_retries=max_network_retries)
+        elif isinstance(account, dict):
+            account = StripeClient(**{'session': session, 'max_network_retries': max_network_retries, **account})
+        clients[name] = account
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {name: executor.submit(client.get_data, resource, start_date, end_date, date_hour_type,
+                                             **kwargs)
+                       for name, client in clients.items()}
+            results = {name: future.exception() or future.result() for name, future in futures.items()}
+    finally:
+        session.close()
+
+    if not return_exceptions:
+        for result in results.values():
+            if isinstance(result, Exception):
+                raise result
+
+    return results
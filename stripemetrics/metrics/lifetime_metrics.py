@@ -0,0 +1,115 @@
+import pandas as pd
+import numpy as np
+from stripemetrics.data_transform import _active_mask, enrich_subscriptions
+from stripemetrics.metrics.subscription_metrics import _monthly_amount
+
+
+def customer_lifetime(sub_df, ch_df, as_of):
+    """
+    Compute tenure, churn date, captured revenue and current MRR of every customer as of a date
+    ('YYYY/MM/DD') in one grouped pass, instead of calling churn_dates and mrr_per_customer per customer.
+
+    Only subscriptions created before as_of are considered (like active_subscriptions). A customer is churned
+    when none of their subscriptions is active at as_of and one was canceled up to as_of, the churn date
+    being the last canceled_at up to as_of (customers still in a long trial are not churned).
+    Tenure runs from the first subscription to the churn date (or as_of), tenure_months uses 30 day months.
+    Revenue is the sum of amount_captured_usd of charges that were not refunded up to as_of (Charge must be
+    enriched with enrich_charges). Product and cohort (month of the first subscription, 'YYYY-MM') come from
+    the customer's first subscription.
+
+    Parameters
+    ----------
+    sub_df : pd.DataFrame
+        Stripe Subscription DataFrame, enriched with product data to get product names
+    ch_df : pd.DataFrame
+        Stripe Charge DataFrame enriched with enrich_charges
+    as_of : str
+        A date of format 'YYYY/MM/DD'
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per customer with first_subscription, cohort, product, churned, churn_date, tenure_days,
+        tenure_months, revenue and mrr
+    """
+    as_of = pd.Timestamp(as_of)
+    subs = sub_df[sub_df['created'] < as_of]
+    if 'plan_amount' not in subs.columns:
+        subs = enrich_subscriptions(subs)
+
+    active = _active_mask(subs, as_of)
+    product_column = 'name' if 'name' in subs.columns else 'product'
+    subs = pd.DataFrame({
+        'customer': subs['customer'],
+        'created': subs['created'],
+        'product': subs[product_column],
+        'active': active,
+        'mrr': np.where(active, _monthly_amount(subs), 0),
+        'canceled_at': subs['canceled_at'].where(subs['canceled_at'] <= as_of),
+    }).sort_values('created', kind='stable')
+
+    lifetime = subs.groupby('customer', observed=True).agg(
+        first_subscription=('created', 'first'),
+        active=('active', 'any'),
+        last_canceled=('canceled_at', 'max'),
+        mrr=('mrr', 'sum'),
+    )
+    # groupby first skips missing values, take the product of the first subscription itself
+    first = subs.drop_duplicates('customer').set_index('customer')
+    lifetime['product'] = first['product'].reindex(lifetime.index)
+
+    lifetime['cohort'] = lifetime['first_subscription'].dt.strftime('%Y-%m')
+    lifetime['churned'] = ~lifetime['active'] & lifetime['last_canceled'].notna()
+    lifetime['churn_date'] = lifetime['last_canceled'].where(lifetime['churned'])
+    lifetime['tenure_days'] = (
+        lifetime['churn_date'].fillna(as_of) - lifetime['first_subscription']).dt.total_seconds() / 86400
+    lifetime['tenure_months'] = lifetime['tenure_days'] / 30
+
+    charges = ch_df[(ch_df['created'] <= as_of) & (ch_df['refunded'] == False)]
+    revenue = charges.groupby('customer', observed=True)['amount_captured_usd'].sum()
+    lifetime['revenue'] = revenue.reindex(lifetime.index, fill_value=0)
+
+    return lifetime[['first_subscription', 'cohort', 'product', 'churned', 'churn_date', 'tenure_days',
+                     'tenure_months', 'revenue', 'mrr']]
+
+
+def lifetime_value(lifetime, by=('product', 'cohort')):
+    """
+    Aggregate ARPU and LTV estimates from customer_lifetime, by product and signup cohort by default.
+
+    arpu is revenue per customer month, monthly_churn_rate is churned customers per customer month, and
+    ltv = arpu / monthly_churn_rate (NaN when no customer churned). realized_ltv is the average revenue
+    captured per customer so far.
+
+    Parameters
+    ----------
+    lifetime : pd.DataFrame
+        DataFrame returned by customer_lifetime
+    by : list or tuple, default ('product', 'cohort')
+        Columns to group by, empty for a single total
+
+    Returns
+    -------
+    pd.DataFrame
+        customers, churned, revenue, mrr, customer_months, arpu, monthly_churn_rate, ltv and realized_ltv
+        per group
+    """
+    by = list(by)
+    df = lifetime.assign(churned=lifetime['churned'].astype(int))
+    grouped = df.groupby(by) if by else df.groupby(np.zeros(len(df), dtype=int))
+
+    ltv = grouped.agg(
+        customers=('churned', 'size'),
+        churned=('churned', 'sum'),
+        revenue=('revenue', 'sum'),
+        mrr=('mrr', 'sum'),
+        customer_months=('tenure_months', 'sum'),
+    )
+
+    customer_months = ltv['customer_months'].where(ltv['customer_months'] > 0)
+    ltv['arpu'] = ltv['revenue'] / customer_months
+    ltv['monthly_churn_rate'] = ltv['churned'] / customer_months
+    ltv['ltv'] = ltv['arpu'] / ltv['monthly_churn_rate'].where(ltv['monthly_churn_rate'] > 0)
+    ltv['realized_ltv'] = ltv['revenue'] / ltv['customers']
+
+    return ltv
@@ -1,28 +1,33 @@
 import pandas as pd
 import numpy as np
 from stripemetrics.data_transform import active_subscribers, active_subscriptions, \
-    churned_customers, churned_subscriptions, enrich_subscriptions, new_subscribers, new_subscriptions
+    churned_customers, churned_subscriptions, enrich_subscriptions, new_subscribers, new_subscriptions, \
+    _active_mask
+
+
+def _monthly_amount(df):
+    # monthly normalized amount with discounts applied (enrich_subscriptions is needed)
+    # discounts only affect MRR when coupon_duration is forever
+    percent_off = np.where(df['coupon_duration'] == 'forever', df['percent_off'], 0)
+
+    return np.where(
+        df['plan_interval'] == 'month', (1 / 100) * df['plan_amount'] * df['quantity'] * (1 - percent_off / 100),
+        np.where(
+            df['plan_interval'] == 'year',
+            (1 / 100) * (1 / 12) * df['plan_amount'] * df['quantity'] * (1 - percent_off / 100), np.nan))
 
 
 def total_mrr(sub_df, date, product=None):
     # enrich_subscriptions is needed
     # note: enrich_subscriptions here does not need prod_df
-    active_subs = active_subscriptions(sub_df, date, product)
-    df = sub_df[sub_df['id'].isin(active_subs)].copy()
+    df = sub_df[_active_mask(sub_df, date, product)].copy()
     df = enrich_subscriptions(df)
 
     if product:
         df = df[df['name'] == product]
 
-    # discounts only affect MRR when coupon_duration is forever
-    df['percent_off'] = np.where(df['coupon_duration'] == 'forever', df['percent_off'], 0)
-
     # creating a column for monthly normalized amount with discounts applied
-    df['plan_amount_month'] = np.where(
-        df['plan_interval'] == 'month', (1 / 100) * df['plan_amount'] * df['quantity'] * (1 - df['percent_off'] / 100),
-        np.where(
-            df['plan_interval'] == 'year',
-            (1 / 100) * (1 / 12) * df['plan_amount'] * df['quantity'] * (1 - df['percent_off'] / 100), np.nan))
+    df['plan_amount_month'] = _monthly_amount(df)
 
     mrr = df['plan_amount_month'].sum()
 
@@ -60,9 +65,9 @@ def churned_subscribers_rate(sub_df, date, product=None, interval=30):
     date_ = pd.Timestamp(date)
     prev_date = date_ - pd.Timedelta(days=interval)
 
-    churned = churned_customers(sub_df, date_, product)
+    churned = churned_customers(sub_df, date_, product, interval)
     prev_active = active_subscribers(sub_df, prev_date)
-    new = new_subscribers(sub_df, date_, product)
+    new = new_subscribers(sub_df, date_, product, interval)
 
     churn_rate = 0
 
@@ -79,7 +84,7 @@ def subscribers_retention_rate(sub_df, date, product=None, interval=30):
 
     cur_active = active_subscribers(sub_df, date_, product)
     prev_active = active_subscribers(sub_df, prev_date, product)
-    new = new_subscribers(sub_df, date_, product)
+    new = new_subscribers(sub_df, date_, product, interval)
 
     retention_rate = 0
 
@@ -94,9 +99,9 @@ def churned_subscriptions_rate(sub_df, date, product=None, interval=30):
     date_ = pd.Timestamp(date)
     prev_date = date_ - pd.Timedelta(days=interval)
 
-    churned = churned_subscriptions(sub_df, date_, product)
+    churned = churned_subscriptions(sub_df, date_, product, interval)
     prev_active = active_subscriptions(sub_df, prev_date, product)
-    new = new_subscriptions(sub_df, date_, product)
+    new = new_subscriptions(sub_df, date_, product, interval)
 
     churn_rate = 0
 
@@ -113,7 +118,7 @@ def subscription_retention_rate(sub_df, date, product=None, interval=30):
 
     cur_active = active_subscriptions(sub_df, date_, product)
     prev_active = active_subscriptions(sub_df, prev_date, product)
-    new = new_subscriptions(sub_df, date_, product)
+    new = new_subscriptions(sub_df, date_, product, interval)
 
     retention_rate = 0
 
@@ -0,0 +1,118 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from .data_transform import active_subscribers, active_subscriptions, churned_customers, churned_subscriptions, \
+    enrich_charges, enrich_subscriptions, new_subscribers, new_subscriptions
+from .date_manipulation import _last_interval_days
+from .fake_server import FakeStripeServer, synthetic_fixtures
+from .ingest import StripeClient
+from .metrics.charge_metrics import total_refunded, total_refunds, total_revenue
+from .metrics.subscription_metrics import churned_subscribers_rate, churned_subscriptions_rate, \
+    subscribers_retention_rate, subscription_retention_rate, total_mrr
+from .sql_engine import DuckDBEngine
+
+
+def _pandas_metrics(sub_df, ch_df, date, product, interval) -> dict:
+    window = lambda d: _last_interval_days(d, interval)
+
+    metrics = {
+        'active_subscriptions': len(active_subscriptions(sub_df, date, product)),
+        'active_subscribers': len(active_subscribers(sub_df, date, product)),
+        'mrr': total_mrr(sub_df, date, product),
+        'new_subscriptions': len(new_subscriptions(sub_df, date, product, interval)),
+        'churned_subscriptions': len(churned_subscriptions(sub_df, date, product, interval)),
+        'new_subscribers': len(new_subscribers(sub_df, date, product, interval)),
+        'churned_customers': len(churned_customers(sub_df, date, product, interval)),
+        'churned_subscriptions_rate': churned_subscriptions_rate(sub_df, date, product, interval),
+        'churned_subscribers_rate': churned_subscribers_rate(sub_df, date, product, interval),
+        'subscription_retention_rate': subscription_retention_rate(sub_df, date, product, interval),
+        'subscribers_retention_rate': subscribers_retention_rate(sub_df, date, product, interval),
+    }
+    if ch_df is not None:
+        metrics['refunded'] = total_refunded(ch_df, date, product, window)
+        metrics['refunds'] = total_refunds(ch_df, date, product, window)
+        # total_revenue filters products through prod_df instead of the enriched name
+        if product is None:
+            metrics['revenue'] = total_revenue(ch_df, date, interval=window)
+
+    return metrics
+
+
+def check_parity(
+        sub_df: pd.DataFrame,
+        ch_df: pd.DataFrame or None = None,
+        dates: list or None = None,
+        products: list or None = None,
+        intervals: list or tuple = (7, 30, 60),
+        engine: DuckDBEngine or None = None
+) -> pd.DataFrame:
+    """
+    Compare DuckDBEngine.grid() against the pandas metric functions for every date x product x interval.
+
+    Parameters
+    ----------
+    sub_df : pd.DataFrame
+        Stripe Subscription DataFrame enriched with enrich_subscriptions
+    ch_df : pd.DataFrame or None, default None
+        Stripe Charge DataFrame enriched with enrich_charges, revenue metrics are skipped without it
+    dates : list or None, default None
+        Dates to compare, defaults to the first day of every quarter spanned by the subscriptions
+    products : list or None, default None
+        Names of Stripe products, None in the list means all products, defaults to all products and each one
+    intervals : list or tuple, default (7, 30, 60)
+        Amounts of days in the past to compare against
+    engine : DuckDBEngine or None, default None
+        Engine to check, defaults to one built from sub_df and ch_df
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per mismatch with date, product, interval, metric, pandas and engine values, empty on parity
+    """
+    if dates is None:
+        dates = pd.date_range(sub_df['created'].min().normalize(), sub_df['created'].max(), freq='QS')
+    if products is None:
+        products = [None] + sorted(sub_df['name'].dropna().unique())
+    own_engine = engine is None
+    if own_engine:
+        engine = DuckDBEngine(sub_df, ch_df)
+
+    mismatches = []
+    try:
+        for interval in intervals:
+            grid = engine.grid(dates, products, interval, revenue=ch_df is not None)
+            for row in grid.itertuples(index=False):
+                expected = _pandas_metrics(sub_df, ch_df, row.date, row.product, interval)
+                for metric, value in expected.items():
+                    if not np.isclose(value, getattr(row, metric)):
+                        mismatches.append({'date': row.date, 'product': row.product, 'interval': interval,
+                                           'metric': metric, 'pandas': value, 'engine': getattr(row, metric)})
+    finally:
+        if own_engine:
+            engine.close()
+
+    return pd.DataFrame(mismatches, columns=['date', 'product', 'interval', 'metric', 'pandas', 'engine'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare DuckDBEngine against the pandas metrics on synthetic data.')
+    parser.add_argument('--subscriptions', type=int, default=2000)
+    parser.add_argument('--charges', type=int, default=2000)
+    parser.add_argument('--intervals', type=int, nargs='+', default=[7, 30, 60])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fixtures = synthetic_fixtures(n_subscriptions=args.subscriptions, n_charges=args.charges, seed=args.seed)
+    with FakeStripeServer(fixtures) as server:
+        client = StripeClient('sk_test_fake', api_base=server.url)
+        sub_df = client.get_data('Subscription', status='all')
+        ch_df = client.get_data('Charge')
+        prod_df = client.get_data('Product')
+        bt_df = client.get_data('BalanceTransaction')
+        client.close()
+
+    result = check_parity(enrich_subscriptions(sub_df, prod_df), enrich_charges(ch_df, prod_df, bt_df),
+                          intervals=args.intervals)
+    print(result.to_string(index=False) if len(result) else 'pandas and DuckDBEngine metrics match')
@@ -0,0 +1,374 @@
+import pandas as pd
+from .date_manipulation import _last_interval_days, _max_hours
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+_subscription_columns = ['id', 'customer', 'created', 'canceled_at', 'cancel_at', 'trial_end', 'status',
+                         'quantity', 'plan_amount', 'plan_interval', 'percent_off', 'coupon_duration', 'name']
+
+_charge_columns = ['id', 'created', 'refunded', 'amount_captured_usd', 'amount_refunded', 'name']
+
+
+# ------------ Flattening -------------
+
+def _get(key):
+    return lambda x: x.get(key) if isinstance(x, dict) else None
+
+
+def _flatten_subscriptions(sub_df: pd.DataFrame) -> pd.DataFrame:
+    df = sub_df.copy()
+
+    if 'plan' in df.columns:
+        df['plan_amount'] = df['plan'].map(_get('amount'))
+        df['plan_interval'] = df['plan'].map(_get('interval'))
+    if 'discount' in df.columns:
+        coupon = df['discount'].map(_get('coupon'))
+        df['percent_off'] = coupon.map(_get('percent_off')).where(~coupon.isna(), 0)
+        df['coupon_duration'] = coupon.map(_get('duration'))
+
+    for column in _subscription_columns:
+        if column not in df.columns:
+            df[column] = None
+
+    return df[_subscription_columns]
+
+
+def _flatten_charges(ch_df: pd.DataFrame) -> pd.DataFrame:
+    df = ch_df.copy()
+    for column in _charge_columns:
+        if column not in df.columns:
+            df[column] = None
+
+    return df[_charge_columns]
+
+
+# ------------ SQL -------------
+
+# subscriptions active at each point (d, product) of a grid, same rules as active_subscriptions
+_active_sql = """
+    SELECT g.d, g.product, s.*
+    FROM {grid} g
+    JOIN subscriptions s
+      ON s.created < g.d
+     AND (s.canceled_at > g.d OR s.canceled_at IS NULL)
+     AND (s.cancel_at > g.d OR s.cancel_at IS NULL)
+     AND (s.trial_end < g.d + to_days({lookahead}) OR s.trial_end IS NULL)
+     AND (g.product IS NULL OR s.name::VARCHAR = g.product::VARCHAR)
+"""
+
+# customers with a subscription canceled in the interval before each point, same rules as churned_customers
+_churned_sql = """
+    SELECT g.d, g.product, s.customer
+    FROM {grid} g
+    JOIN subscriptions s
+      ON s.status = 'canceled'
+     AND s.canceled_at > g.d - to_days({interval})
+     AND s.canceled_at < g.d
+     AND (g.product IS NULL OR s.name::VARCHAR = g.product::VARCHAR)
+"""
+
+# monthly normalized amount with discounts applied, discounts only affect MRR when coupon_duration is forever
+_mrr_sql = """
+    CASE plan_interval
+        WHEN 'month' THEN (1 / 100) * plan_amount * quantity
+            * (1 - (CASE WHEN coupon_duration = 'forever' THEN percent_off ELSE 0 END) / 100)
+        WHEN 'year' THEN (1 / 100) * (1 / 12) * plan_amount * quantity
+            * (1 - (CASE WHEN coupon_duration = 'forever' THEN percent_off ELSE 0 END) / 100)
+    END
+"""
+
+_revenue_sql = """
+revenue AS (
+    SELECT g.d, g.product,
+           coalesce(sum(c.amount_captured_usd) FILTER (WHERE NOT c.refunded), 0) AS revenue,
+           coalesce(sum(c.amount_refunded / 100), 0) AS refunded,
+           count(*) FILTER (WHERE c.refunded) AS refunds
+    FROM grid g
+    JOIN charges c
+      ON c.created >= g.d - to_days({interval})
+     AND c.created <= g.d + INTERVAL 1 DAY - INTERVAL 1 MICROSECOND
+     AND (g.product IS NULL OR c.name::VARCHAR = g.product::VARCHAR)
+    GROUP BY g.d, g.product
+)
+"""
+
+_grid_sql = """
+WITH
+cur AS ({cur_active}),
+prev AS ({prev_active}),
+cur_subscriptions AS (
+    SELECT d, product, count(*) AS active_subscriptions, count(DISTINCT customer) AS active_subscribers,
+           coalesce(sum({mrr}) FILTER (WHERE plan_amount IS NOT NULL), 0) AS mrr
+    FROM cur GROUP BY d, product
+),
+prev_subscriptions AS (
+    SELECT d, product, count(*) AS prev_active_subscriptions, count(DISTINCT customer) AS prev_active_subscribers
+    FROM prev GROUP BY d, product
+),
+new_subscriptions AS (
+    SELECT d, product, count(*) AS new_subscriptions FROM cur
+    WHERE NOT EXISTS (SELECT 1 FROM prev WHERE prev.d = cur.d AND prev.product IS NOT DISTINCT FROM cur.product
+                                            AND prev.id = cur.id)
+    GROUP BY d, product
+),
+churned_subscriptions AS (
+    SELECT d, product, count(*) AS churned_subscriptions FROM prev
+    WHERE NOT EXISTS (SELECT 1 FROM cur WHERE prev.d = cur.d AND prev.product IS NOT DISTINCT FROM cur.product
+                                           AND prev.id = cur.id)
+    GROUP BY d, product
+),
+new_subscribers AS (
+    SELECT d, product, count(*) AS new_subscribers FROM (
+        SELECT DISTINCT d, product, customer FROM cur
+        EXCEPT
+        SELECT DISTINCT d, product, customer FROM prev
+    ) GROUP BY d, product
+),
+churned_customers AS (
+    SELECT d, product, count(DISTINCT customer) AS churned_customers FROM ({churned}) GROUP BY d, product
+),
+prev_all_subscribers AS (
+    SELECT d, count(DISTINCT customer) AS prev_all_active_subscribers FROM ({prev_all_active}) GROUP BY d
+)
+{revenue_cte}
+SELECT g.d AS date, g.product,
+       coalesce(active_subscriptions, 0) AS active_subscriptions,
+       coalesce(active_subscribers, 0) AS active_subscribers,
+       coalesce(mrr, 0) AS mrr,
+       coalesce(new_subscriptions, 0) AS new_subscriptions,
+       coalesce(churned_subscriptions, 0) AS churned_subscriptions,
+       coalesce(new_subscribers, 0) AS new_subscribers,
+       coalesce(prev_active_subscriptions, 0) AS prev_active_subscriptions,
+       coalesce(prev_active_subscribers, 0) AS prev_active_subscribers,
+       coalesce(churned_customers, 0) AS churned_customers,
+       coalesce(prev_all_active_subscribers, 0) AS prev_all_active_subscribers
+       {revenue_columns}
+FROM grid g
+LEFT JOIN cur_subscriptions cs ON cs.d = g.d AND cs.product IS NOT DISTINCT FROM g.product
+LEFT JOIN prev_subscriptions ps ON ps.d = g.d AND ps.product IS NOT DISTINCT FROM g.product
+LEFT JOIN new_subscriptions ns ON ns.d = g.d AND ns.product IS NOT DISTINCT FROM g.product
+LEFT JOIN churned_subscriptions chs ON chs.d = g.d AND chs.product IS NOT DISTINCT FROM g.product
+LEFT JOIN new_subscribers nsb ON nsb.d = g.d AND nsb.product IS NOT DISTINCT FROM g.product
+LEFT JOIN churned_customers cc ON cc.d = g.d AND cc.product IS NOT DISTINCT FROM g.product
+LEFT JOIN prev_all_subscribers pas ON pas.d = g.d
+{revenue_join}
+ORDER BY g.d, g.product NULLS FIRST
+"""
+
+
+class DuckDBEngine:
+    """
+    Compute subscription and charge metrics as SQL in an in-process DuckDB, with multi-threaded and
+    out-of-core execution.
+
+    Results match the pandas implementations (active_subscriptions, total_mrr, total_revenue, ...), so
+    metrics over large date x product grids can be computed in one query with grid().
+
+    Subscription frames may be raw (plan and discount are flattened) or enriched with product data,
+    Charge frames must be enriched with enrich_charges for revenue and product filters.
+    Parquet files are expected to hold the flattened tables written by save_parquet().
+
+    Parameters
+    ----------
+    sub_df : pd.DataFrame or None, default None
+        Stripe Subscription DataFrame
+    ch_df : pd.DataFrame or None, default None
+        Stripe Charge DataFrame, enriched with enrich_charges
+    database : str, default ':memory:'
+        DuckDB database file, a file allows spilling to disk
+    threads : int or None, default None
+        Amount of threads used by DuckDB, defaults to all cores
+    memory_limit : str or None, default None
+        DuckDB memory limit such as '4GB', larger queries spill to disk
+    """
+
+    def __init__(
+            self,
+            sub_df: pd.DataFrame or None = None,
+            ch_df: pd.DataFrame or None = None,
+            database: str = ':memory:',
+            threads: int or None = None,
+            memory_limit: str or None = None
+    ):
+        if duckdb is None:
+            raise ImportError('DuckDBEngine requires duckdb, install it with `pip install duckdb`')
+
+        self.con = duckdb.connect(database)
+        if threads:
+            self.con.execute(f'SET threads TO {int(threads)}')
+        if memory_limit:
+            self.con.execute(f'SET memory_limit = {_quote(memory_limit)}')
+
+        if sub_df is not None:
+            self.register_subscriptions(sub_df)
+        if ch_df is not None:
+            self.register_charges(ch_df)
+
+    @classmethod
+    def from_parquet(
+            cls,
+            subscriptions: str or None = None,
+            charges: str or None = None,
+            **kwargs
+    ) -> 'DuckDBEngine':
+        engine = cls(**kwargs)
+        if subscriptions is not None:
+            engine.con.execute(
+                f'CREATE OR REPLACE VIEW subscriptions AS SELECT * FROM read_parquet({_quote(subscriptions)})')
+        if charges is not None:
+            engine.con.execute(
+                f'CREATE OR REPLACE VIEW charges AS SELECT * FROM read_parquet({_quote(charges)})')
+
+        return engine
+
+    def register_subscriptions(self, sub_df: pd.DataFrame):
+        self.con.register('subscriptions', _flatten_subscriptions(sub_df))
+
+    def register_charges(self, ch_df: pd.DataFrame):
+        self.con.register('charges', _flatten_charges(ch_df))
+
+    def save_parquet(self, subscriptions: str or None = None, charges: str or None = None):
+        if subscriptions is not None:
+            self.con.execute(f'COPY subscriptions TO {_quote(subscriptions)} (FORMAT PARQUET)')
+        if charges is not None:
+            self.con.execute(f'COPY charges TO {_quote(charges)} (FORMAT PARQUET)')
+
+    # ------------ Queries -------------
+
+    def _point(self, date, product: str or None = None):
+        self.con.register('point', pd.DataFrame({'d': [pd.Timestamp(date)], 'product': [product]},
+                                                columns=['d', 'product']).astype({'product': object}))
+
+    def _active(self, date, product: str or None, interval: int, select: str) -> pd.DataFrame:
+        self._point(date, product)
+        sql = f'SELECT {select} FROM ({_active_sql.format(grid="point", lookahead=int(interval))})'
+
+        return self.con.execute(sql).df()
+
+    def active_subscriptions(self, date: str, product: str or None = None, interval: int = 30) -> pd.Series:
+        return self._active(date, product, interval, 'id')['id']
+
+    def active_subscribers(self, date: str, product: str or None = None, interval: int = 30) -> pd.Series:
+        return self._active(date, product, interval, 'DISTINCT customer')['customer']
+
+    def total_mrr(self, date: str, product: str or None = None) -> float:
+        mrr = self._active(date, product, 30, f'sum({_mrr_sql}) FILTER (WHERE plan_amount IS NOT NULL) AS mrr')
+
+        return float(mrr['mrr'].fillna(0).iloc[0])
+
+    def churned_customers(self, date: str, product: str or None = None, interval: int = 30) -> pd.Series:
+        self._point(date, product)
+        sql = f'SELECT DISTINCT customer FROM ({_churned_sql.format(grid="point", interval=int(interval))})'
+
+        return self.con.execute(sql).df()['customer']
+
+    def churned_subscribers_rate(self, date: str, product: str or None = None, interval: int = 30) -> float:
+        return float(self.grid([date], [product], interval, revenue=False)['churned_subscribers_rate'].iloc[0])
+
+    def churned_subscriptions_rate(self, date: str, product: str or None = None, interval: int = 30) -> float:
+        return float(self.grid([date], [product], interval, revenue=False)['churned_subscriptions_rate'].iloc[0])
+
+    def _charges(self, date: str, product: str or None, interval: int, select: str):
+        date_, last_date = _last_interval_days(date, interval)
+        where = 'created >= $1 AND created <= $2'
+        params = [last_date, _max_hours(date_)]
+        if product is not None:
+            where += ' AND name = $3'
+            params.append(product)
+
+        return self.con.execute(f'SELECT {select} FROM charges WHERE {where}', params).fetchone()[0]
+
+    def total_revenue(self, date: str, product: str or None = None, interval: int = 30) -> float:
+        return self._charges(date, product, interval,
+                             'coalesce(sum(amount_captured_usd) FILTER (WHERE NOT refunded), 0)')
+
+    def total_refunded(self, date: str, product: str or None = None, interval: int = 30) -> float:
+        return self._charges(date, product, interval, 'coalesce(sum(amount_refunded / 100), 0)')
+
+    def total_refunds(self, date: str, product: str or None = None, interval: int = 30) -> int:
+        return self._charges(date, product, interval, 'count(*) FILTER (WHERE refunded)')
+
+    def grid(
+            self,
+            dates: list or pd.DatetimeIndex,
+            products: list or None = None,
+            interval: int = 30,
+            revenue: bool = True
+    ) -> pd.DataFrame:
+        """
+        Compute metrics for every date x product in one query.
+
+        Parameters
+        ----------
+        dates : list or pd.DatetimeIndex
+            Dates to compute metrics for
+        products : list or None, default None
+            Names of Stripe products, None in the list means all products
+        interval : int, default 30
+            Amount of days in the past to compare against (new, churned and revenue metrics)
+        revenue : bool, default True
+            Also compute revenue metrics, needs registered charges
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per date and product with active_subscriptions, active_subscribers, mrr, new_subscriptions,
+            churned_subscriptions, new_subscribers, churned_customers, churned_subscriptions_rate,
+            churned_subscribers_rate, subscription_retention_rate, subscribers_retention_rate and, if revenue,
+            revenue, refunded and refunds
+        """
+        products = products if products is not None else [None]
+        grid = pd.MultiIndex.from_product([pd.DatetimeIndex(dates), products], names=['d', 'product']).to_frame(
+            index=False).astype({'product': object})
+        prev_grid = grid.assign(d=grid['d'] - pd.Timedelta(days=interval), cur_d=grid['d'])
+        # like churned_subscribers_rate, previous subscribers are counted over every product
+        prev_all_grid = pd.DataFrame({'cur_d': pd.DatetimeIndex(dates).unique()})
+        prev_all_grid = prev_all_grid.assign(d=prev_all_grid['cur_d'] - pd.Timedelta(days=interval),
+                                             product=None).astype({'product': object})
+        self.con.register('grid', grid)
+        self.con.register('prev_grid', prev_grid)
+        self.con.register('prev_all_grid', prev_all_grid)
+
+        prev_active = _active_sql.format(grid='prev_grid', lookahead=30).replace('SELECT g.d,', 'SELECT g.cur_d AS d,')
+        prev_all_active = _active_sql.format(grid='prev_all_grid', lookahead=30).replace('SELECT g.d,',
+                                                                                         'SELECT g.cur_d AS d,')
+        sql = _grid_sql.format(
+            cur_active=_active_sql.format(grid='grid', lookahead=30),
+            prev_active=prev_active,
+            prev_all_active=prev_all_active,
+            churned=_churned_sql.format(grid='grid', interval=int(interval)),
+            mrr=_mrr_sql,
+            revenue_cte=',' + _revenue_sql.format(interval=int(interval)) if revenue else '',
+            revenue_columns=', coalesce(r.revenue, 0) AS revenue, coalesce(r.refunded, 0) AS refunded, '
+                            'coalesce(r.refunds, 0) AS refunds' if revenue else '',
+            revenue_join='LEFT JOIN revenue r ON r.d = g.d AND r.product IS NOT DISTINCT FROM g.product'
+            if revenue else ''
+        )
+        df = self.con.execute(sql).df()
+        df['product'] = df['product'].astype(object).where(df['product'].notna(), None)
+
+        # same formulas as churned_subscriptions_rate and the retention rates
+        subscriptions_base = df['prev_active_subscriptions'] + df['new_subscriptions']
+        df['churned_subscriptions_rate'] = (df['churned_subscriptions'] / subscriptions_base).where(
+            subscriptions_base != 0, 0)
+        subscribers_base = df['prev_all_active_subscribers'] + df['new_subscribers']
+        df['churned_subscribers_rate'] = (df['churned_customers'] / subscribers_base).where(subscribers_base != 0, 0)
+        df['subscription_retention_rate'] = (
+            (df['active_subscriptions'] - df['new_subscriptions']) / df['prev_active_subscriptions']).where(
+            df['prev_active_subscriptions'] != 0, 0)
+        df['subscribers_retention_rate'] = (
+            (df['active_subscribers'] - df['new_subscribers']) / df['prev_active_subscribers']).where(
+            df['prev_active_subscribers'] != 0, 0)
+
+        return df.drop(columns='prev_all_active_subscribers')
+
+    def close(self):
+        self.con.close()
+
+
+def _quote(path: str) -> str:
+    return "'" + str(path).replace("'", "''") + "'"